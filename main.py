@@ -4,17 +4,34 @@ Handles video rendering with FFmpeg on Render.com
 """
 
 import os
-import uuid
 import subprocess
 import tempfile
 import shutil
 import asyncio
+import collections
+import contextlib
+import fcntl
+import itertools
+import json
+import mmap
+import re
+import struct
+import threading
+import time
+import zipfile
 from pathlib import Path
+from typing import List
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, BackgroundTasks
+import aiofiles
+import blake3
+from streaming_form_data import StreamingFormDataParser
+from streaming_form_data.targets import BaseTarget, ValueTarget
+
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
+from starlette.requests import ClientDisconnect
 
 app = FastAPI(title="Video Subtitle Generator API")
 
@@ -27,9 +44,167 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Temp directory for processing
-TEMP_DIR = Path(tempfile.gettempdir()) / "video_subtitle"
-TEMP_DIR.mkdir(exist_ok=True)
+# Temp directory for processing - prefer tmpfs when it has room, so FFmpeg's
+# reads and writes hit memory instead of contending with uploads for the disk
+SHM_DIR = Path("/dev/shm")
+SHM_MIN_FREE_BYTES = 4 * 1024 ** 3
+try:
+    USE_SHM = shutil.disk_usage(SHM_DIR).free > SHM_MIN_FREE_BYTES
+except OSError:
+    USE_SHM = False
+DISK_TEMP_DIR = Path(tempfile.gettempdir()) / "video_subtitle"
+TEMP_DIR = SHM_DIR / "video_subtitle" if USE_SHM else DISK_TEMP_DIR
+# tmpfs is RAM and only checked once here, so each new job re-checks free space
+# (see job_root) and falls back to the disk directory when tmpfs runs low
+JOB_ROOTS = (TEMP_DIR, DISK_TEMP_DIR) if USE_SHM else (TEMP_DIR,)
+for root in JOB_ROOTS:
+    root.mkdir(exist_ok=True)
+
+# Dedicated font directory for libass - a fontconfig config listing only this
+# directory keeps each FFmpeg run from scanning every system font directory
+FONTS_DIR = Path(os.environ.get("FONTS_DIR", "/app/fonts"))
+HAS_FONTS_DIR = (FONTS_DIR / "fonts.conf").is_file()
+FFMPEG_ENV = {**os.environ, "FONTCONFIG_PATH": str(FONTS_DIR)} if HAS_FONTS_DIR else None
+
+# Kernel dirty-page thresholds (percent of memory) - flush earlier to avoid write stalls
+DIRTY_PAGE_SYSCTLS = {
+    "/proc/sys/vm/dirty_background_ratio": "5",
+    "/proc/sys/vm/dirty_ratio": "10",
+}
+
+# Content-addressed cache of finished renders (same filesystem as jobs, for hardlinks)
+CACHE_DIR = TEMP_DIR / "cache"
+CACHE_DIR.mkdir(exist_ok=True)
+
+# Evict least recently used cached renders once the cache exceeds this many MB.
+# On tmpfs the cache is held in RAM, so it is also capped to a quarter of /dev/shm.
+CACHE_MAX_MB = int(os.environ.get("CACHE_MAX_MB", 2048))
+SHM_CACHE_FRACTION = 4
+if USE_SHM:
+    CACHE_MAX_MB = min(CACHE_MAX_MB, shutil.disk_usage(SHM_DIR).total // SHM_CACHE_FRACTION // (1024 * 1024))
+
+# Bytes currently stored under TEMP_DIR, tracked incrementally and shared by all
+# workers: an 8-byte counter file mapped into each process (at startup) and
+# updated under flock. flock is per open file, so threads of one process (request
+# handlers and threadpool background tasks) are serialised by a threading lock.
+STORAGE_COUNTER_PATH = TEMP_DIR / "storage_bytes"
+STORAGE_COUNTER_FD = None
+STORAGE_COUNTER = None
+STORAGE_LOCK = threading.Lock()
+
+# Job IDs only disambiguate local temp dirs: PID (unique per worker) + process start
+# time (PIDs repeat across container restarts) + per-process counter
+JOB_SEQ = itertools.count()
+JOB_PID = os.getpid()
+JOB_EPOCH = int(time.time())
+
+# Files created inside each job directory
+JOB_FILES = ("input.mp4", "subtitles.ass", "output.mp4")
+
+# Upload copy buffer size (1 MiB)
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Response streaming buffer size (1 MiB)
+RESPONSE_CHUNK_SIZE = 1 << 20
+
+# NVENC hardware encoder availability (detected at startup)
+HAS_NVENC = False
+
+# ASS header - only size, margin and font vary per request. PlayRes matches
+# FFmpeg's own SRT->ASS conversion so font sizes render as they did before.
+ASS_HEADER_TEMPLATE = (
+    "[Script Info]\n"
+    "ScriptType: v4.00+\n"
+    "PlayResX: 384\n"
+    "PlayResY: 288\n"
+    "ScaledBorderAndShadow: yes\n"
+    "\n"
+    "[V4+ Styles]\n"
+    "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+    "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, "
+    "Shadow, Alignment, MarginL, MarginR, MarginV, Encoding\n"
+    "Style: Default,{fn},{fs},&H00FFFFFF,&H000000FF,&H00000000,&H00000000,"
+    "-1,0,0,0,100,100,0,0,1,2,0,2,10,10,{mv},1\n"
+    "\n"
+    "[Events]\n"
+    "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+)
+
+# SRT cue timing line, e.g. "00:00:01,500 --> 00:00:03,250"
+SRT_TIMING_RE = re.compile(
+    r"(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})"
+)
+# SRT cue text markup, handled like FFmpeg's SRT decoder: the first {\anN} passes
+# through, other {\...} override blocks are dropped, ASS specials are escaped and the
+# <b>/<i>/<u>/<s>/<font> tags are converted. Any other <...> is kept as plain text.
+SRT_MARKUP_RE = re.compile(
+    r"(?P<an>\{\\an[1-9]\})|(?P<override>\{\\[^}]*\})|(?P<escape>[\\{}])"
+    r"|<\s*(?P<close>/?)\s*(?P<tag>b|i|u|s|font)\b(?P<attrs>[^>]*)>",
+    re.IGNORECASE
+)
+SRT_FONT_ATTR_RE = re.compile(
+    r"""(color|face|size)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""",
+    re.IGNORECASE
+)
+# <font> attribute -> ASS override tag
+SRT_FONT_TAGS = {"color": "c", "face": "fn", "size": "fs"}
+SRT_COLOR_NAMES = {
+    "white": "ffffff", "black": "000000", "red": "ff0000", "lime": "00ff00",
+    "green": "008000", "blue": "0000ff", "yellow": "ffff00", "cyan": "00ffff",
+    "aqua": "00ffff", "magenta": "ff00ff", "fuchsia": "ff00ff", "silver": "c0c0c0",
+    "gray": "808080", "grey": "808080", "maroon": "800000", "olive": "808000",
+    "purple": "800080", "teal": "008080", "navy": "000080", "orange": "ffa500",
+}
+
+# Invariant parts of the FFmpeg command line (copied per request)
+FFMPEG_BASE_ARGS = ("ffmpeg", "-y", "-nostdin", "-hide_banner")
+# NVDEC decodes into system memory (the ass filter needs CPU frames anyway) and FFmpeg
+# falls back to software decoding for codecs NVDEC cannot handle
+NVENC_HWACCEL_ARGS = ("-hwaccel", "cuda")
+# h264_nvenc only takes 8-bit 4:2:0 - converts 10-bit (p010) sources such as HDR phone video
+NVENC_INPUT_FILTER = "format=yuv420p"
+# Strip all metadata and data streams to prevent filename overlay
+FFMPEG_OUTPUT_ARGS = (
+    "-dn",                        # Disable data streams (may contain text overlays)
+    "-map_metadata", "-1",        # Strip all metadata
+    "-metadata", "title=",        # Clear title
+    "-metadata", "comment=",      # Clear comment
+    "-metadata", "description=",  # Clear description
+)
+
+# Admission control - encodes beyond the limit queue instead of overcommitting CPU/GPU.
+# Both limits are host totals shared by all uvicorn workers. Encodes hold one of
+# MAX_CONCURRENT_ENCODES flock'd slot files; waiting jobs hold a flock'd marker file
+# in the queue directory so /storage can report host-wide queue depth.
+MAX_CONCURRENT_ENCODES = int(os.environ.get("MAX_CONCURRENT_ENCODES", "2"))
+MAX_CONCURRENT_UPLOADS = int(os.environ.get("MAX_CONCURRENT_UPLOADS", "8"))
+ENCODE_SLOTS_DIR = TEMP_DIR / "encode_slots"
+ENCODE_SLOTS_DIR.mkdir(exist_ok=True)
+ENCODE_QUEUE_DIR = TEMP_DIR / "encode_queue"
+ENCODE_QUEUE_DIR.mkdir(exist_ok=True)
+ENCODE_SLOT_POLL_SECONDS = 0.25
+# Uploads only need a soft cap, so split the host total evenly across workers
+# (WEB_CONCURRENCY is exported to the workers by the __main__ block)
+WORKER_COUNT = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+UPLOAD_SEM = asyncio.Semaphore(max(1, MAX_CONCURRENT_UPLOADS // WORKER_COUNT))
+
+# Each batch segment adds a decoder split branch and an encoder to one FFmpeg run.
+# With NVENC a batch holds one encode slot per segment (one encoder session each),
+# so it is further capped at MAX_CONCURRENT_ENCODES.
+MAX_BATCH_SEGMENTS = int(os.environ.get("MAX_BATCH_SEGMENTS", "16"))
+
+# Entries under TEMP_DIR that are not job directories
+CONTROL_DIRS = (CACHE_DIR, ENCODE_SLOTS_DIR, ENCODE_QUEUE_DIR)
+
+# FFmpeg stderr is streamed and only the last lines are kept (a few KiB)
+STDERR_TAIL_LINES = 64
+STDERR_READ_SIZE = 4096
+
+# Upper bound for the output video bitrate (bits/s)
+MAX_VIDEO_BITRATE = 8_000_000
+
+# Source AAC audio at or below this bitrate (bits/s) is copied instead of re-encoded
+MAX_AUDIO_COPY_BITRATE = 160_000
 
 
 class SubtitleStyle(BaseModel):
@@ -38,23 +213,561 @@ class SubtitleStyle(BaseModel):
     font_name: str = "Arial"
 
 
-def cleanup_job_dir(job_dir: Path):
+class VideoFileResponse(FileResponse):
+    """
+    FileResponse that streams in 1 MiB reads instead of Starlette's 64 KiB default.
+    ASGI servers advertising the http.response.pathsend extension still get the
+    zero-copy path, since FileResponse emits it itself.
+    """
+    chunk_size = RESPONSE_CHUNK_SIZE
+
+
+class HashingFileTarget(BaseTarget):
+    """
+    streaming-form-data target that writes a multipart file part straight to
+    disk, feeding the hasher and the storage counter as chunks arrive.
+    """
+    def __init__(self, path: Path, hasher):
+        super().__init__()
+        self.path = path
+        self.hasher = hasher
+        self.total_bytes = 0
+        self.received = False
+        self._file = None
+    
+    def on_start(self):
+        self.received = True
+        self._file = open(self.path, "wb", buffering=UPLOAD_CHUNK_SIZE)
+    
+    def on_data_received(self, chunk: bytes):
+        self._file.write(chunk)
+        self.hasher.update(chunk)
+        self.total_bytes += len(chunk)
+        add_storage_bytes(len(chunk))
+    
+    def on_finish(self):
+        self.close()
+    
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def job_root():
+    """Parent directory for a new job - tmpfs while it keeps SHM_MIN_FREE_BYTES free, else disk."""
+    if USE_SHM:
+        try:
+            if shutil.disk_usage(SHM_DIR).free > SHM_MIN_FREE_BYTES:
+                return TEMP_DIR
+        except OSError:
+            pass
+        return DISK_TEMP_DIR
+    return TEMP_DIR
+
+
+def new_job_id():
+    """Return a job ID unique across workers on this host."""
+    return f"{JOB_PID:x}-{JOB_EPOCH:x}-{next(JOB_SEQ):x}"
+
+
+def open_storage_counter():
+    """Map the shared storage counter, seeding it with a deep scan if the file is new."""
+    global STORAGE_COUNTER_FD, STORAGE_COUNTER
+    fd = os.open(STORAGE_COUNTER_PATH, os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        # First worker to get here does the scan; the rest see the seeded file
+        if os.fstat(fd).st_size < 8:
+            seed = int(get_storage_usage(deep=True) * 1024 * 1024)
+            os.pwrite(fd, struct.pack("q", seed), 0)
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    STORAGE_COUNTER_FD = fd
+    STORAGE_COUNTER = mmap.mmap(fd, 8)
+
+
+@contextlib.contextmanager
+def locked_storage_counter():
+    """Hold the storage counter exclusively across threads and worker processes."""
+    with STORAGE_LOCK:
+        fcntl.flock(STORAGE_COUNTER_FD, fcntl.LOCK_EX)
+        try:
+            yield STORAGE_COUNTER
+        finally:
+            fcntl.flock(STORAGE_COUNTER_FD, fcntl.LOCK_UN)
+
+
+def add_storage_bytes(delta: int):
+    """Adjust the tracked storage usage by delta bytes."""
+    with locked_storage_counter() as counter:
+        value = struct.unpack_from("q", counter)[0]
+        struct.pack_into("q", counter, 0, max(0, value + delta))
+
+
+def reset_storage_bytes():
+    """Set the tracked storage usage to zero."""
+    with locked_storage_counter() as counter:
+        struct.pack_into("q", counter, 0, 0)
+
+
+def unlink_tracked(path: Path):
+    """Delete a file and subtract its size from the tracked storage usage."""
+    try:
+        st = os.stat(path)
+        os.unlink(path)
+    except FileNotFoundError:
+        return
+    # Files still hardlinked elsewhere (e.g. into the cache) keep occupying disk
+    if st.st_nlink == 1:
+        add_storage_bytes(-st.st_size)
+
+
+def cleanup_job_dir(job_dir: Path, names=JOB_FILES):
     """Clean up job directory after response is sent."""
     try:
         if job_dir.exists():
-            shutil.rmtree(job_dir)
+            # Job directories hold a known set of files - unlink them directly instead of walking the tree
+            for name in names:
+                unlink_tracked(job_dir / name)
+            try:
+                os.rmdir(job_dir)
+            except OSError:
+                shutil.rmtree(job_dir, ignore_errors=True)  # Fallback for unexpected leftovers
             print(f"[Cleanup] Deleted job directory: {job_dir}")
     except Exception as e:
         print(f"[Cleanup] Error deleting {job_dir}: {e}")
 
 
-def get_storage_usage():
-    """Get current storage usage in MB."""
+def detect_nvenc():
+    """Check whether FFmpeg can encode with NVIDIA's h264_nvenc."""
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"],
+            capture_output=True, text=True, timeout=10
+        )
+        if "h264_nvenc" not in result.stdout:
+            return False
+        # Distro builds list nvenc even without a GPU - run a 1-frame test encode
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-f", "lavfi", "-i", "nullsrc=s=256x256:d=0.04",
+             "-c:v", "h264_nvenc", "-f", "null", "-"],
+            capture_output=True, text=True, timeout=30
+        )
+        return result.returncode == 0
+    except Exception:
+        return False
+
+
+def refresh_font_cache():
+    """Refresh the fontconfig cache for the dedicated font directory if it is stale."""
+    if not HAS_FONTS_DIR:
+        print(f"[INFO] No fonts.conf in {FONTS_DIR}, libass will use system fontconfig")
+        return
+    try:
+        # No -f: the image already builds this cache, so this only rescans changed dirs
+        subprocess.run(["fc-cache", str(FONTS_DIR)], capture_output=True, timeout=120,
+                       env=FFMPEG_ENV)
+        print(f"[INFO] Font cache ready: {FONTS_DIR}")
+    except Exception as e:
+        print(f"[WARNING] fc-cache failed: {e}")
+
+
+def tune_dirty_page_thresholds():
+    """Best-effort: lower kernel dirty-page ratios. Needs root and writable /proc/sys."""
+    for path, value in DIRTY_PAGE_SYSCTLS.items():
+        try:
+            with open(path, "w") as f:
+                f.write(value)
+            print(f"[INFO] Set {path} = {value}")
+        except OSError as e:
+            print(f"[INFO] Could not set {path}: {e}")
+
+
+async def probe_streams(path: Path):
+    """
+    Probe the input with a single ffprobe run. Returns (video_bitrate, audio_info):
+    the first video stream's bitrate in bits/s (None if unknown) and the first
+    audio stream's codec_name/bit_rate (empty dict if unknown).
+    """
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "quiet",
+            "-show_entries", "stream=codec_type,codec_name,bit_rate",
+            "-of", "json",
+            str(path),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=30)
+        streams = json.loads(stdout.decode()).get("streams") or []
+    except Exception:
+        return None, {}
+    
+    video = next((st for st in streams if st.get("codec_type") == "video"), {})
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), {})
+    try:
+        video_bitrate = int(video["bit_rate"])
+    except (KeyError, ValueError):
+        video_bitrate = None
+    return video_bitrate, audio
+
+
+def evict_cache():
+    """Delete least recently used cached renders until the cache is under CACHE_MAX_MB."""
+    try:
+        # Only the cache directory is scanned - no walk over job directories
+        entries = []
+        with os.scandir(CACHE_DIR) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".mp4"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        cache_bytes = sum(size for _, size, _ in entries)
+        limit_bytes = CACHE_MAX_MB * 1024 * 1024
+        for _, size, path in sorted(entries):
+            if cache_bytes <= limit_bytes:
+                break
+            unlink_tracked(Path(path))
+            cache_bytes -= size
+            print(f"[Cache] Evicted {os.path.basename(path)} ({size / (1024 * 1024):.2f} MB)")
+    except Exception as e:
+        print(f"[Cache] Error evicting: {e}")
+
+
+async def save_video(video: UploadFile, path: Path, hasher=None):
+    """Stream an uploaded video to disk in chunks, feeding the hasher if given. Returns bytes written."""
+    total_bytes = 0
+    with open(path, "wb", buffering=UPLOAD_CHUNK_SIZE) as f:
+        while True:
+            buf = await video.read(UPLOAD_CHUNK_SIZE)
+            if not buf:
+                break
+            f.write(buf)
+            if hasher is not None:
+                hasher.update(buf)
+            total_bytes += len(buf)
+            add_storage_bytes(len(buf))
+    return total_bytes
+
+
+async def save_subtitles(content: str, path: Path):
+    """Write subtitle content to disk without blocking the event loop."""
+    async with aiofiles.open(path, "w", encoding="utf-8") as f:
+        await f.write(content)
+    add_storage_bytes(len(content.encode("utf-8")))
+
+
+def build_audio_codec_args(audio_info: dict):
+    """Copy AAC audio that is already at a reasonable bitrate, otherwise re-encode to AAC 128k."""
+    try:
+        bit_rate = int(audio_info.get("bit_rate", 0))
+    except ValueError:
+        bit_rate = 0
+    if audio_info.get("codec_name") == "aac" and 0 < bit_rate <= MAX_AUDIO_COPY_BITRATE:
+        return ["-c:a", "copy"]
+    return ["-c:a", "aac", "-b:a", "128k"]
+
+
+def resolve_font_name(font_name: str):
+    """Map requested font to an installed one - use Noto Sans CJK for Chinese support."""
+    if "Source Han" in font_name or "Noto" in font_name:
+        return "Noto Sans CJK SC"
+    return font_name.replace(",", " ")  # Commas delimit ASS style fields
+
+
+def srt_timestamp_to_ass(hours: str, minutes: str, seconds: str, millis: str):
+    """Convert SRT timestamp fields to ASS H:MM:SS.cc."""
+    centis = int(millis.ljust(3, "0")) // 10
+    return f"{int(hours)}:{int(minutes):02d}:{int(seconds):02d}.{centis:02d}"
+
+
+def srt_color_to_ass(value: str):
+    """Convert an HTML color (#rrggbb, #rgb or a basic name) to ASS &HBBGGRR&, or None."""
+    value = value.strip().lower()
+    value = SRT_COLOR_NAMES.get(value, value).lstrip("#")
+    if len(value) == 3:
+        value = "".join(c * 2 for c in value)
+    if not re.fullmatch(r"[0-9a-f]{6}", value):
+        return None
+    return f"&H{value[4:6]}{value[2:4]}{value[0:2]}&".upper()
+
+
+def parse_srt_font_attrs(attrs: str):
+    """Return the ASS values of a <font> tag's color/face/size attributes."""
+    values = {}
+    for m in SRT_FONT_ATTR_RE.finditer(attrs):
+        name = m.group(1).lower()
+        value = next(v for v in m.group(2, 3, 4) if v is not None).strip()
+        if name == "color":
+            value = srt_color_to_ass(value)
+        elif name == "size":
+            value = value if value.isdigit() else None
+        else:
+            value = re.sub(r"[\\{}]", "", value) or None
+        if value is not None:
+            values[name] = value
+    return values
+
+
+def srt_text_to_ass(text: str):
+    """Convert SRT cue text to an ASS dialogue text field."""
+    an_seen = False
+    fonts = []  # Attributes of the currently open <font> tags, innermost last
+
+    def convert(m):
+        nonlocal an_seen
+        if m.group("an"):
+            if an_seen:
+                return ""
+            an_seen = True
+            return m.group("an")
+        if m.group("override"):
+            return ""
+        if m.group("escape"):
+            return "\\" + m.group("escape")
+        tag = m.group("tag").lower()
+        if tag != "font":
+            return f"{{\\{tag}{0 if m.group('close') else 1}}}"
+        if m.group("close"):
+            if not fonts:
+                return ""
+            # Restore each attribute the closed tag set to the enclosing value (or the style default)
+            closed = fonts.pop()
+            overrides = "".join(
+                f"\\{SRT_FONT_TAGS[name]}" + next((f[name] for f in reversed(fonts) if name in f), "")
+                for name in closed
+            )
+        else:
+            opened = parse_srt_font_attrs(m.group("attrs"))
+            fonts.append(opened)
+            overrides = "".join(f"\\{SRT_FONT_TAGS[name]}{value}" for name, value in opened.items())
+        return f"{{{overrides}}}" if overrides else ""
+
+    return SRT_MARKUP_RE.sub(convert, text).replace("\n", "\\N")
+
+
+def srt_to_ass(srt_text: str, style: SubtitleStyle):
+    """Convert SRT content to a complete ASS script with the style embedded."""
+    lines = [ASS_HEADER_TEMPLATE.format(
+        fn=resolve_font_name(style.font_name),
+        fs=style.font_size,
+        mv=style.margin_v
+    )]
+    srt_text = srt_text.lstrip("\ufeff").replace("\r\n", "\n").replace("\r", "\n")
+    for block in re.split(r"\n\s*\n", srt_text.strip()):
+        block_lines = block.split("\n")
+        for i, line in enumerate(block_lines):
+            match = SRT_TIMING_RE.search(line)
+            if match:
+                start = srt_timestamp_to_ass(*match.group(1, 2, 3, 4))
+                end = srt_timestamp_to_ass(*match.group(5, 6, 7, 8))
+                text = srt_text_to_ass("\n".join(block_lines[i + 1:]).strip())
+                lines.append(f"Dialogue: 0,{start},{end},Default,,0,0,0,,{text}\n")
+                break
+    return "".join(lines)
+
+
+def build_subtitles_filter(ass_name: str):
+    """Build the ass filter for a pre-styled ASS file."""
+    # No fontsdir= - libass would load every font there into memory on each run;
+    # FONTCONFIG_PATH already restricts fontconfig to FONTS_DIR
+    return f"ass={ass_name}"
+
+
+def build_video_codec_args(target_bitrate: int):
+    """Video encoder arguments for NVENC (when available) or libx264, capped at target_bitrate."""
+    if HAS_NVENC:
+        return [
+            "-c:v", "h264_nvenc",
+            "-preset", "p4",
+            "-tune", "hq",
+            "-rc:v", "vbr",
+            "-multipass", "fullres",
+            "-rc-lookahead", "20",
+            "-b:v", str(target_bitrate),
+            "-maxrate", str(target_bitrate),
+            "-bufsize", str(2 * target_bitrate),
+        ]
+    # libx264 has no NVENC-style multipass here - use capped CRF instead
+    return [
+        "-c:v", "libx264",
+        "-preset", "fast",
+        "-crf", "23",
+        "-maxrate", str(target_bitrate),
+        "-bufsize", str(2 * target_bitrate),
+    ]
+
+
+def try_lock_encode_slots(count: int = 1):
+    """Lock count free host-wide encode slots without blocking. Returns the locked fds, or None."""
+    fds = []
+    for i in range(MAX_CONCURRENT_ENCODES):
+        fd = os.open(ENCODE_SLOTS_DIR / f"slot_{i}", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        fds.append(fd)
+        if len(fds) == count:
+            return fds
+    # All or nothing - release partial holds so two batches cannot deadlock
+    for fd in fds:
+        os.close(fd)
+    return None
+
+
+async def acquire_encode_slots(job_id: str, count: int = 1):
+    """Wait for count host-wide encode slots. Returns fds; closing them releases the slots."""
+    marker = ENCODE_QUEUE_DIR / job_id
+    # The marker is flock'd while waiting; if the worker dies the lock goes with it,
+    # so count_waiting_encodes ignores any marker left behind
+    marker_fd = os.open(marker, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(marker_fd, fcntl.LOCK_EX)
+        while True:
+            fds = try_lock_encode_slots(count)
+            if fds is not None:
+                return fds
+            await asyncio.sleep(ENCODE_SLOT_POLL_SECONDS)
+    finally:
+        marker.unlink(missing_ok=True)
+        os.close(marker_fd)
+
+
+def is_flocked(path: Path):
+    """True if another process holds an exclusive flock on path."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+    try:
+        # A shared probe never blocks a waiter from taking the lock exclusively
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        return False
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+
+
+def count_running_encodes():
+    """Count encode slots currently held by any worker on this host."""
+    return sum(is_flocked(ENCODE_SLOTS_DIR / f"slot_{i}") for i in range(MAX_CONCURRENT_ENCODES))
+
+
+def count_waiting_encodes():
+    """Count jobs waiting for an encode slot on this host (live, locked queue markers only)."""
+    with os.scandir(ENCODE_QUEUE_DIR) as entries:
+        return sum(is_flocked(entry.path) for entry in entries)
+
+
+async def read_stderr_tail(stream: asyncio.StreamReader):
+    """
+    Drain FFmpeg's stderr, keeping only the last STDERR_TAIL_LINES lines.
+    Splits on CR as well as LF, since progress updates are CR-terminated.
+    """
+    ring = collections.deque(maxlen=STDERR_TAIL_LINES)
+    partial = b""
+    while True:
+        chunk = await stream.read(STDERR_READ_SIZE)
+        if not chunk:
+            break
+        lines = re.split(rb"[\r\n]", partial + chunk)
+        partial = lines.pop()[-STDERR_READ_SIZE:]
+        ring.extend(line for line in lines if line)
+    if partial:
+        ring.append(partial)
+    return ring
+
+
+async def run_ffmpeg(cmd: list, job_id: str, job_dir: Path, output_paths: list, job_files=JOB_FILES, slots: int = 1):
+    """
+    Run FFmpeg inside job_dir without blocking the event loop, holding slots
+    of the MAX_CONCURRENT_ENCODES host-wide encode slots. Cleans up job_dir
+    (unlinking job_files) and raises HTTPException on spawn failure,
+    timeout or nonzero exit.
+    """
+    print(f"[Job {job_id}] Running FFmpeg...")
+    print(f"[Job {job_id}] Command: {' '.join(cmd)}")
+    
+    slot_fds = await acquire_encode_slots(job_id, slots)
+    try:
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=job_dir,
+                env=FFMPEG_ENV
+            )
+        except Exception as subprocess_error:
+            print(f"[Job {job_id}] create_subprocess_exec exception: {subprocess_error}")
+            cleanup_job_dir(job_dir, job_files)
+            raise HTTPException(status_code=500, detail=f"FFmpeg subprocess error: {str(subprocess_error)}")
+        
+        stderr_task = asyncio.create_task(read_stderr_tail(proc.stderr))
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=600)
+        except asyncio.TimeoutError:
+            print(f"[Job {job_id}] FFmpeg timed out, killing process")
+            proc.kill()
+            await proc.wait()
+            timed_out = True
+        else:
+            timed_out = False
+        stderr_tail = await stderr_task
+    finally:
+        for fd in slot_fds:
+            os.close(fd)  # Drops the flock, freeing the slot
+    
+    # Account for outputs (complete or partial) before any cleanup path subtracts them
+    for output_path in output_paths:
+        if output_path.exists():
+            add_storage_bytes(output_path.stat().st_size)
+    
+    if timed_out:
+        cleanup_job_dir(job_dir, job_files)
+        raise HTTPException(status_code=500, detail="Processing timeout")
+    
+    stderr_text = b"\n".join(stderr_tail).decode(errors="replace")
+    
+    # Log FFmpeg output regardless of result
+    print(f"[Job {job_id}] FFmpeg return code: {proc.returncode}")
+    if stderr_text:
+        print(f"[Job {job_id}] FFmpeg stderr (last 1000 chars): {stderr_text[-1000:]}")
+    
+    if proc.returncode != 0:
+        print(f"[Job {job_id}] FFmpeg FAILED with code {proc.returncode}")
+        # Clean up on error
+        cleanup_job_dir(job_dir, job_files)
+        raise HTTPException(status_code=500, detail=f"FFmpeg error: {stderr_text[-500:]}")
+
+
+def get_storage_usage(deep: bool = False):
+    """
+    Get current storage usage in MB.
+    By default returns the incrementally tracked counter; deep=True walks
+    the job roots instead (counting hardlinked files once) to audit for drift.
+    """
+    if not deep:
+        return struct.unpack_from("q", STORAGE_COUNTER)[0] / (1024 * 1024)
+    
     total_size = 0
-    if TEMP_DIR.exists():
-        for f in TEMP_DIR.rglob("*"):
+    seen_inodes = set()
+    for root in JOB_ROOTS:
+        if not root.exists():
+            continue
+        for f in root.rglob("*"):
             if f.is_file():
-                total_size += f.stat().st_size
+                st = f.stat()
+                if (st.st_dev, st.st_ino) in seen_inodes:
+                    continue
+                seen_inodes.add((st.st_dev, st.st_ino))
+                total_size += st.st_size
     return total_size / (1024 * 1024)  # Convert to MB
 
 
@@ -74,14 +787,23 @@ async def health():
 
 
 @app.get("/storage")
-async def storage_info():
-    """Get storage usage information."""
-    storage_mb = get_storage_usage()
-    job_count = len(list(TEMP_DIR.iterdir())) if TEMP_DIR.exists() else 0
+async def storage_info(deep: bool = False):
+    """Get storage usage information. Pass ?deep=1 to rescan the temp directory."""
+    storage_mb = get_storage_usage(deep=deep)
+    job_count = sum(
+        len([d for d in root.iterdir() if d.is_dir() and d not in CONTROL_DIRS])
+        for root in JOB_ROOTS if root.exists()
+    )
+    cached_renders = len(list(CACHE_DIR.glob("*.mp4"))) if CACHE_DIR.exists() else 0
     return {
         "temp_storage_mb": round(storage_mb, 2),
         "job_directories": job_count,
-        "temp_dir": str(TEMP_DIR)
+        "cached_renders": cached_renders,
+        "encodes_running": count_running_encodes(),
+        "encodes_waiting": count_waiting_encodes(),
+        "temp_dir": str(TEMP_DIR),
+        "temp_dirs": [str(root) for root in JOB_ROOTS],
+        "cache_max_mb": CACHE_MAX_MB
     }
 
 
@@ -90,9 +812,19 @@ async def manual_cleanup():
     """Manually clean up all temporary files."""
     try:
         if TEMP_DIR.exists():
-            before_mb = get_storage_usage()
-            shutil.rmtree(TEMP_DIR)
-            TEMP_DIR.mkdir(exist_ok=True)
+            before_mb = get_storage_usage(deep=True)
+            # Keep the encode slot/queue directories and the shared storage
+            # counter - other workers hold locks and mappings on them
+            for root in JOB_ROOTS:
+                for entry in root.iterdir():
+                    if entry in (ENCODE_SLOTS_DIR, ENCODE_QUEUE_DIR, STORAGE_COUNTER_PATH):
+                        continue
+                    if entry.is_dir():
+                        shutil.rmtree(entry, ignore_errors=True)
+                    else:
+                        entry.unlink(missing_ok=True)
+            CACHE_DIR.mkdir(exist_ok=True)
+            reset_storage_bytes()
             return {
                 "status": "cleaned",
                 "freed_mb": round(before_mb, 2)
@@ -102,112 +834,140 @@ async def manual_cleanup():
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/render")
-async def render_video(
-    background_tasks: BackgroundTasks,
-    video: UploadFile = File(...),
-    srt_content: str = Form(...),
-    font_size: int = Form(24),
-    margin_v: int = Form(30),
-    font_name: str = Form("Arial")
-):
+# /render parses its body by hand, so describe the multipart form for the OpenAPI docs
+RENDER_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "required": ["video", "srt_content"],
+                "properties": {
+                    "video": {"type": "string", "format": "binary"},
+                    "srt_content": {"type": "string"},
+                    "font_size": {"type": "integer", "default": SubtitleStyle().font_size},
+                    "margin_v": {"type": "integer", "default": SubtitleStyle().margin_v},
+                    "font_name": {"type": "string", "default": SubtitleStyle().font_name},
+                },
+            }
+        }
+    },
+}
+
+
+@app.post("/render", openapi_extra={"requestBody": RENDER_REQUEST_BODY})
+async def render_video(request: Request, background_tasks: BackgroundTasks):
     """
     Render video with burned-in subtitles.
-    Accepts video file upload and SRT content.
+    Accepts a multipart form with a video file and SRT content, plus optional
+    font_size, margin_v and font_name fields. The body is parsed as it streams
+    in and the video is written straight to disk.
     Returns processed video file.
     Files are automatically cleaned up after response.
     """
-    job_id = str(uuid.uuid4())[:8]
-    job_dir = TEMP_DIR / job_id
-    job_dir.mkdir(exist_ok=True)
+    job_id = new_job_id()
+    job_dir = job_root() / job_id
+    job_dir.mkdir()
     
     try:
-        # Save uploaded video
+        # Parse the multipart body with the C parser, video goes direct to disk
         video_path = job_dir / "input.mp4"
-        with open(video_path, "wb") as f:
-            content = await video.read()
-            f.write(content)
+        ass_path = job_dir / "subtitles.ass"
+        hasher = blake3.blake3()
+        video_target = HashingFileTarget(video_path, hasher)
+        fields = {name: ValueTarget() for name in ("srt_content", "font_size", "margin_v", "font_name")}
+        async with UPLOAD_SEM:
+            try:
+                parser = StreamingFormDataParser(headers=request.headers)
+                parser.register("video", video_target)
+                for name, target in fields.items():
+                    parser.register(name, target)
+                async for chunk in request.stream():
+                    parser.data_received(chunk)
+            except Exception as e:
+                # Flush the buffered upload first so cleanup subtracts every byte the counter saw
+                video_target.close()
+                cleanup_job_dir(job_dir)
+                if isinstance(e, ClientDisconnect):
+                    raise HTTPException(status_code=400, detail="Client disconnected during upload")
+                raise HTTPException(status_code=400, detail=f"Invalid multipart body: {e}")
+            finally:
+                video_target.close()
         
-        print(f"[Job {job_id}] Received video: {len(content) / (1024*1024):.2f} MB")
+        srt_content = fields["srt_content"].value.decode("utf-8", errors="replace")
+        if not video_target.received or not srt_content:
+            cleanup_job_dir(job_dir)
+            raise HTTPException(status_code=422, detail="video and srt_content are required")
+        try:
+            style = SubtitleStyle(
+                font_size=int(fields["font_size"].value or 24),
+                margin_v=int(fields["margin_v"].value or 30),
+                font_name=fields["font_name"].value.decode("utf-8", errors="replace") or "Arial"
+            )
+        except ValueError as e:
+            cleanup_job_dir(job_dir)
+            raise HTTPException(status_code=422, detail=f"Invalid style field: {e}")
+        total_bytes = video_target.total_bytes
         
-        # Save SRT file
-        srt_path = job_dir / "subtitles.srt"
-        with open(srt_path, "w", encoding="utf-8") as f:
-            f.write(srt_content)
+        # Convert SRT to a styled ASS script in-process
+        ass_content = srt_to_ass(srt_content, style)
+        await save_subtitles(ass_content, ass_path)
+        
+        print(f"[Job {job_id}] Received video: {total_bytes / (1024*1024):.2f} MB")
         
         # Output path
         output_path = job_dir / "output.mp4"
         
-        # Build force_style string - use Noto Sans CJK for Chinese support
-        # Replace spaces with escaped spaces for FFmpeg filter parsing
-        actual_font = "Noto Sans CJK SC" if "Source Han" in font_name or "Noto" in font_name else font_name
-        actual_font_escaped = actual_font.replace(" ", "\\ ")  # Escape spaces
-        
-        force_style = (
-            f"FontSize={font_size},"
-            f"MarginV={margin_v},"
-            f"FontName={actual_font_escaped},"
-            f"PrimaryColour=&H00FFFFFF,"
-            f"OutlineColour=&H00000000,"
-            f"Outline=2,"
-            f"Bold=1"
-        )
+        # Identical (video, subtitles + style) input - serve the cached render
+        hasher.update(ass_content.encode("utf-8"))
+        digest = hasher.hexdigest()[:32]
+        cached_path = CACHE_DIR / f"{digest}.mp4"
+        # Hardlink the cached render into the job dir and serve the link, so a
+        # concurrent eviction cannot unlink it mid-response. If the entry is gone
+        # (evicted or never cached) fall through to a normal encode.
+        try:
+            os.link(cached_path, output_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[Job {job_id}] Cache link failed: {e}")
+        else:
+            print(f"[Job {job_id}] Cache hit: {digest}")
+            os.utime(output_path)  # Shared inode - marks the cache entry as recently used
+            background_tasks.add_task(cleanup_job_dir, job_dir)
+            return VideoFileResponse(
+                str(output_path),
+                media_type="video/mp4",
+                filename=f"subtitled_{job_id}.mp4"
+            )
         
-        # Escape paths for FFmpeg
-        srt_escaped = str(srt_path).replace("\\", "/").replace(":", "\\:")
+        # Build -vf filter. FFmpeg runs inside job_dir, so the subtitles are referenced by
+        # their bare file name and no drive-letter/colon escaping of the path is needed.
+        vf_filter = build_subtitles_filter(ass_path.name)
+        if HAS_NVENC:
+            vf_filter = f"{NVENC_INPUT_FILTER},{vf_filter}"
         
-        # Build -vf filter - wrap force_style in single quotes to handle special chars
-        vf_filter = f"subtitles={srt_escaped}:force_style='{force_style}'"
+        # Cap output bitrate at the source bitrate so encode time stays predictable
+        source_bitrate, audio_info = await probe_streams(video_path)
+        target_bitrate = min(source_bitrate or MAX_VIDEO_BITRATE, MAX_VIDEO_BITRATE)
+        print(f"[Job {job_id}] Source bitrate: {source_bitrate}, target: {target_bitrate}, audio: {audio_info}")
         
         # FFmpeg command - strip all metadata and data streams to prevent filename overlay
-        cmd = [
-            "ffmpeg",
-            "-y",
+        cmd = list(FFMPEG_BASE_ARGS)
+        if HAS_NVENC:
+            cmd += NVENC_HWACCEL_ARGS
+        cmd += [
             "-i", str(video_path),
             "-map", "0:v:0",          # Only first video stream
             "-map", "0:a:0?",         # Only first audio stream (optional)
             "-vf", vf_filter,
-            "-c:v", "libx264",
-            "-preset", "fast",
-            "-crf", "23",
-            "-c:a", "aac",
-            "-b:a", "128k",
-            "-dn",                    # Disable data streams (may contain text overlays)
-            "-map_metadata", "-1",    # Strip all metadata
-            "-metadata", "title=",    # Clear title
-            "-metadata", "comment=",  # Clear comment
-            "-metadata", "description=",  # Clear description
-            str(output_path)
         ]
+        cmd += build_video_codec_args(target_bitrate)
+        cmd += build_audio_codec_args(audio_info)
+        cmd += FFMPEG_OUTPUT_ARGS
+        cmd.append(str(output_path))
         
-        print(f"[Job {job_id}] Running FFmpeg...")
-        print(f"[Job {job_id}] Command: {' '.join(cmd)}")
-        
-        # Run FFmpeg with exception handling
-        try:
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=600
-            )
-        except Exception as subprocess_error:
-            print(f"[Job {job_id}] subprocess.run exception: {subprocess_error}")
-            cleanup_job_dir(job_dir)
-            raise HTTPException(status_code=500, detail=f"FFmpeg subprocess error: {str(subprocess_error)}")
-        
-        # Log FFmpeg output regardless of result
-        print(f"[Job {job_id}] FFmpeg return code: {result.returncode}")
-        if result.stdout:
-            print(f"[Job {job_id}] FFmpeg stdout: {result.stdout[:500]}")
-        if result.stderr:
-            print(f"[Job {job_id}] FFmpeg stderr (last 1000 chars): {result.stderr[-1000:]}")
-        
-        if result.returncode != 0:
-            print(f"[Job {job_id}] FFmpeg FAILED with code {result.returncode}")
-            # Clean up on error
-            cleanup_job_dir(job_dir)
-            raise HTTPException(status_code=500, detail=f"FFmpeg error: {result.stderr[-500:]}")
+        await run_ffmpeg(cmd, job_id, job_dir, [output_path])
         
         if not output_path.exists():
             print(f"[Job {job_id}] Output file not found at: {output_path}")
@@ -217,19 +977,25 @@ async def render_video(
         output_size = output_path.stat().st_size / (1024*1024)
         print(f"[Job {job_id}] Output ready: {output_size:.2f} MB")
         
+        # Hardlink into the cache (no copy), survives job directory cleanup
+        try:
+            os.link(output_path, cached_path)
+        except FileExistsError:
+            pass
+        except OSError as e:
+            print(f"[Job {job_id}] Could not cache output: {e}")
+        
         # Schedule cleanup after response is sent
         background_tasks.add_task(cleanup_job_dir, job_dir)
+        background_tasks.add_task(evict_cache)
         
         # Return the processed video
-        return FileResponse(
+        return VideoFileResponse(
             str(output_path),
             media_type="video/mp4",
             filename=f"subtitled_{job_id}.mp4"
         )
         
-    except subprocess.TimeoutExpired:
-        cleanup_job_dir(job_dir)
-        raise HTTPException(status_code=500, detail="Processing timeout")
     except HTTPException:
         raise
     except Exception as e:
@@ -238,6 +1004,122 @@ async def render_video(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/render_batch")
+async def render_batch(
+    background_tasks: BackgroundTasks,
+    video: UploadFile = File(...),
+    srt_segments: List[str] = Form(...),
+    styles: str = Form("[]")
+):
+    """
+    Render one video with several subtitle tracks in a single FFmpeg run.
+    Accepts video file upload, repeated srt_segments fields and an optional
+    JSON list of SubtitleStyle objects (one per segment, or one for all).
+    Returns a zip archive with one processed video per segment.
+    """
+    try:
+        style_list = [SubtitleStyle(**style) for style in json.loads(styles)]
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid styles: {e}")
+    
+    count = len(srt_segments)
+    max_segments = min(MAX_BATCH_SEGMENTS, MAX_CONCURRENT_ENCODES) if HAS_NVENC else MAX_BATCH_SEGMENTS
+    if count > max_segments:
+        raise HTTPException(status_code=400, detail=f"At most {max_segments} srt segments per batch")
+    if not style_list:
+        style_list = [SubtitleStyle()] * count
+    elif len(style_list) == 1:
+        style_list = style_list * count
+    elif len(style_list) != count:
+        raise HTTPException(status_code=400, detail="styles must have one entry or one per srt segment")
+    
+    job_id = new_job_id()
+    job_dir = job_root() / job_id
+    job_dir.mkdir()
+    
+    ass_names = [f"subtitles_{i}.ass" for i in range(count)]
+    output_names = [f"output_{i}.mp4" for i in range(count)]
+    job_files = ("input.mp4", *ass_names, *output_names, "outputs.zip")
+    
+    try:
+        # Convert SRT segments to styled ASS scripts, then save them and the uploaded video concurrently
+        ass_contents = [srt_to_ass(srt, style) for srt, style in zip(srt_segments, style_list)]
+        video_path = job_dir / "input.mp4"
+        async with UPLOAD_SEM:
+            results = await asyncio.gather(
+                save_video(video, video_path),
+                *(save_subtitles(ass, job_dir / name) for ass, name in zip(ass_contents, ass_names))
+            )
+        total_bytes = results[0]
+        
+        print(f"[Job {job_id}] Received video: {total_bytes / (1024*1024):.2f} MB, {count} subtitle segments")
+        
+        # Split the decoded video once, burn each subtitle track on its own branch
+        filter_parts = []
+        split_source = f"[0:v]{NVENC_INPUT_FILTER}," if HAS_NVENC else "[0:v]"
+        filter_parts.append(split_source + f"split={count}" + "".join(f"[v{i}]" for i in range(count)))
+        for i, ass_name in enumerate(ass_names):
+            filter_parts.append(f"[v{i}]{build_subtitles_filter(ass_name)}[o{i}]")
+        filter_complex = ";".join(filter_parts)
+        
+        # Cap output bitrate at the source bitrate so encode time stays predictable
+        source_bitrate, audio_info = await probe_streams(video_path)
+        target_bitrate = min(source_bitrate or MAX_VIDEO_BITRATE, MAX_VIDEO_BITRATE)
+        video_codec_args = build_video_codec_args(target_bitrate)
+        audio_codec_args = build_audio_codec_args(audio_info)
+        
+        cmd = list(FFMPEG_BASE_ARGS)
+        if HAS_NVENC:
+            cmd += NVENC_HWACCEL_ARGS
+        cmd += ["-i", str(video_path), "-filter_complex", filter_complex]
+        output_paths = []
+        for i, output_name in enumerate(output_names):
+            output_path = job_dir / output_name
+            output_paths.append(output_path)
+            cmd += ["-map", f"[o{i}]", "-map", "0:a:0?"]
+            cmd += video_codec_args
+            cmd += audio_codec_args
+            cmd += FFMPEG_OUTPUT_ARGS
+            cmd.append(str(output_path))
+        
+        # One NVENC session per output, so hold one encode slot per segment
+        await run_ffmpeg(cmd, job_id, job_dir, output_paths, job_files, slots=count if HAS_NVENC else 1)
+        
+        missing = [p.name for p in output_paths if not p.exists()]
+        if missing:
+            print(f"[Job {job_id}] Output files not found: {missing}")
+            cleanup_job_dir(job_dir, job_files)
+            raise HTTPException(status_code=500, detail="Output file not created")
+        
+        # Package outputs - mp4 is already compressed, so store without deflate
+        zip_path = job_dir / "outputs.zip"
+        
+        def write_zip():
+            with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as zf:
+                for i, output_path in enumerate(output_paths):
+                    zf.write(output_path, arcname=f"subtitled_{job_id}_{i}.mp4")
+        
+        await asyncio.to_thread(write_zip)
+        add_storage_bytes(zip_path.stat().st_size)
+        print(f"[Job {job_id}] Batch ready: {zip_path.stat().st_size / (1024*1024):.2f} MB")
+        
+        # Schedule cleanup after response is sent
+        background_tasks.add_task(cleanup_job_dir, job_dir, job_files)
+        
+        return VideoFileResponse(
+            str(zip_path),
+            media_type="application/zip",
+            filename=f"subtitled_{job_id}.zip"
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[Job {job_id}] Error: {e}")
+        cleanup_job_dir(job_dir, job_files)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.on_event("startup")
 async def startup():
     print("[INFO] Video Subtitle Generator Cloud API Starting...")
@@ -248,7 +1130,17 @@ async def startup():
     except Exception as e:
         print(f"[WARNING] FFmpeg not found: {e}")
     
-    # Report storage usage
+    # Check NVENC hardware encoder
+    global HAS_NVENC
+    HAS_NVENC = detect_nvenc()
+    print(f"[INFO] NVENC encoder: {'enabled' if HAS_NVENC else 'not available, using libx264'}")
+    
+    # Temp storage location and write-back tuning
+    print(f"[INFO] Temp directory: {TEMP_DIR} ({'tmpfs' if USE_SHM else 'disk'}), cache cap {CACHE_MAX_MB} MB")
+    tune_dirty_page_thresholds()
+    
+    # Map the shared storage counter (seeded with leftovers from previous runs)
+    open_storage_counter()
     storage_mb = get_storage_usage()
     print(f"[INFO] Current temp storage: {storage_mb:.2f} MB")
 
@@ -256,4 +1148,22 @@ async def startup():
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 10000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = int(os.environ.get("WEB_CONCURRENCY", max(2, (os.cpu_count() or 1) // 2)))
+    # Workers read this to split host-wide limits
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    # Start from a fresh storage scan - the first worker reseeds the counter
+    STORAGE_COUNTER_PATH.unlink(missing_ok=True)
+    # Drop queue markers left by a previous run's killed workers
+    shutil.rmtree(ENCODE_QUEUE_DIR, ignore_errors=True)
+    ENCODE_QUEUE_DIR.mkdir(exist_ok=True)
+    # Once here rather than in every worker's startup
+    refresh_font_cache()
+    # Import string is required for multiple workers
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools"
+    )
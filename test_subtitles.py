@@ -0,0 +1,49 @@
+from main import SubtitleStyle, srt_text_to_ass, srt_to_ass
+
+
+def test_basic_tags():
+    assert srt_text_to_ass("<b>bold</b> <i>it</i> <u>u</u> <s>gone</s>") == (
+        "{\\b1}bold{\\b0} {\\i1}it{\\i0} {\\u1}u{\\u0} {\\s1}gone{\\s0}"
+    )
+
+
+def test_first_alignment_tag_passes_through():
+    assert srt_text_to_ass("{\\an8}Top line") == "{\\an8}Top line"
+    assert srt_text_to_ass("{\\an8}Top{\\an2} line") == "{\\an8}Top line"
+
+
+def test_other_override_blocks_dropped():
+    assert srt_text_to_ass("{\\pos(10,10)}Text") == "Text"
+
+
+def test_font_color_face_size():
+    assert srt_text_to_ass('<font color="#ff0000">Red</font>') == "{\\c&H0000FF&}Red{\\c}"
+    assert srt_text_to_ass("<font color=red>Red</font>") == "{\\c&H0000FF&}Red{\\c}"
+    assert srt_text_to_ass('<font face="Arial" size="30">A</font>') == "{\\fnArial\\fs30}A{\\fn\\fs}"
+
+
+def test_nested_font_restores_outer_color():
+    assert srt_text_to_ass('<font color="#00ff00">a<font color="#0000ff">b</font>c</font>') == (
+        "{\\c&H00FF00&}a{\\c&HFF0000&}b{\\c&H00FF00&}c{\\c}"
+    )
+
+
+def test_unknown_angle_brackets_kept():
+    assert srt_text_to_ass("I <3 you >:(") == "I <3 you >:("
+    assert srt_text_to_ass("<br>") == "<br>"
+
+
+def test_ass_specials_escaped():
+    assert srt_text_to_ass("C:\\new") == "C:\\\\new"
+    assert srt_text_to_ass("{not a tag}") == "\\{not a tag\\}"
+
+
+def test_line_breaks():
+    assert srt_text_to_ass("one\ntwo") == "one\\Ntwo"
+
+
+def test_srt_to_ass_dialogue():
+    srt = "\ufeff1\r\n00:00:01,500 --> 00:00:03,250\r\n{\\an8}<i>Hi</i>\r\nthere\r\n\r\n2\r\n00:00:04,000 --> 00:00:05,000\r\nBye\r\n"
+    ass = srt_to_ass(srt, SubtitleStyle())
+    assert "Dialogue: 0,0:00:01.50,0:00:03.25,Default,,0,0,0,,{\\an8}{\\i1}Hi{\\i0}\\Nthere\n" in ass
+    assert "Dialogue: 0,0:00:04.00,0:00:05.00,Default,,0,0,0,,Bye\n" in ass